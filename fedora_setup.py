@@ -1,9 +1,22 @@
+import atexit
+import functools
+import hashlib
+import itertools
+import json
 import sys
 import os
+import re
+import selectors
+import shlex
+import shutil
 import subprocess
+import tempfile
 import time
-import threading
-from typing import Any, Literal, Optional
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Iterable, Iterator, Literal, Optional, Sequence
 
 
 # --- ANSI Color Codes  ---
@@ -19,10 +32,37 @@ class C:
     UNDERLINE = "\033[4m"
 
 
+@dataclass(slots=True, frozen=True)
+class Task:
+    """
+    One immutable setup task. Frozen + slots keeps attribute access a slot
+    load instead of a dict lookup, and the tuple fields make tasks hashable.
+    """
+
+    id: str
+    desc: str
+    type: str = "shell"
+    commands: tuple[tuple[str, ...], ...] = ()
+    packages: tuple[str, ...] = ()
+    package_name: str = ""
+    group_name: str = ""
+    config_file: str = ""
+    config_lines: tuple[str, ...] = ()
+    use_shell: bool = False
+    # (path, content) pairs written from Python before commands run —
+    # avoids shelling out to `sh -c 'echo ... > file'`
+    write_files: tuple[tuple[str, str], ...] = ()
+    check_type: str = ""
+    check_command: tuple[str, ...] = ()
+    check_grep: str = ""
+    check_path: str = ""
+
+
 # --- Task Definitions ---
 # Based on https://www.debugpoint.com/10-things-to-do-fedora-43-after-install/
-# and other common user tasks.
-TASKS: dict[str, list[dict[str, Any]]] = {
+# and other common user tasks. Raw dict literals here; frozen into Task
+# instances (TASKS) right below.
+_TASK_DEFS: dict[str, list[dict[str, Any]]] = {
     "1. Essentials (Must-Do)": [
         {
             "id": "1",
@@ -43,6 +83,7 @@ TASKS: dict[str, list[dict[str, Any]]] = {
                     "https://mirrors.rpmfusion.org/nonfree/fedora/rpmfusion-nonfree-release-$(rpm -E %fedora).noarch.rpm",
                 ]
             ],
+            # $(rpm -E %fedora) in the URLs is substituted before exec
             "check_type": "file",
             "check_path": "/etc/yum.repos.d/rpmfusion-free.repo",
         },
@@ -214,26 +255,152 @@ TASKS: dict[str, list[dict[str, Any]]] = {
                     "--import",
                     "https://packages.microsoft.com/keys/microsoft.asc",
                 ],
-                [
-                    "sh",
-                    "-c",
-                    'echo -e "[code]\nname=Visual Studio Code\nbaseurl=https://packages.microsoft.com/yumrepos/vscode\nenabled=1\ngpgcheck=1\ngpgkey=https://packages.microsoft.com/keys/microsoft.asc" > /etc/yum.repos.d/vscode.repo',
-                ],
                 ["dnf", "check-update"],
                 ["dnf", "install", "-y", "code"],
             ],
+            "write_files": [
+                (
+                    "/etc/yum.repos.d/vscode.repo",
+                    "[code]\n"
+                    "name=Visual Studio Code\n"
+                    "baseurl=https://packages.microsoft.com/yumrepos/vscode\n"
+                    "enabled=1\n"
+                    "gpgcheck=1\n"
+                    "gpgkey=https://packages.microsoft.com/keys/microsoft.asc\n",
+                )
+            ],
         },
     ],
 }
 
-# --- Global Spinner Control ---
-spinner_running = False
-spinner_stop_event = threading.Event()
+def _freeze_task(entry: dict[str, Any]) -> Task:
+    """Converts a raw task dict literal into an immutable Task."""
+    entry = dict(entry)
+    if "commands" in entry:
+        entry["commands"] = tuple(tuple(cmd) for cmd in entry["commands"])
+    if "write_files" in entry:
+        entry["write_files"] = tuple(tuple(pair) for pair in entry["write_files"])
+    for key in ("packages", "config_lines", "check_command"):
+        if key in entry:
+            entry[key] = tuple(entry[key])
+    return Task(**entry)
+
+
+TASKS: dict[str, list[Task]] = {
+    category: [_freeze_task(entry) for entry in entries]
+    for category, entries in _TASK_DEFS.items()
+}
+
+# Flat views of TASKS, computed once at import (TASKS never changes at runtime)
+_ALL_TASKS: list[Task] = [t for group in TASKS.values() for t in group]
+_TASK_BY_ID: dict[str, Task] = {t.id: t for t in _ALL_TASKS}
+_ALL_TASK_IDS: frozenset[str] = frozenset(_TASK_BY_ID)
+_SORTED_TASK_IDS: list[str] = sorted(_TASK_BY_ID, key=int)
+
+# --- Persistent "already done" cache ---
+# Completed task IDs are remembered across invocations so re-running the
+# script doesn't redo the slow rpm/flatpak/dnf-group probes for tasks that
+# already succeeded. Entries stay valid as long as the datastore the check
+# reads (rpm database, flatpak installation, config file) hasn't changed
+# since the entry was written. Disable with --no-cache.
+CACHE_FILE = os.path.expanduser("~/.cache/fedora-setup/done.json")
+_RPM_DB_PATH = "/var/lib/rpm/rpmdb.sqlite"
+# The script runs as root, so flatpaks land in the system installation;
+# flatpak touches this stamp file whenever that installation changes.
+_FLATPAK_STAMP_PATH = "/var/lib/flatpak/.changed"
+
+_done_cache: dict[str, dict[str, Any]] = {}
+_cache_enabled = "--no-cache" not in sys.argv
+_cache_dirty = False
+
+
+def _task_signature(task: Task) -> str:
+    """Stable hash of a task definition; invalidates cache entries on edits."""
+    return hashlib.sha256(
+        json.dumps(asdict(task), sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _task_cacheable(task: Task) -> bool:
+    # Only cache tasks whose pre-check can prove completion; plain shell
+    # tasks (e.g. the full system update) must always run.
+    return task.type in ("dnf", "flatpak", "group", "config")
+
+
+def _state_stamp(task: Task) -> Optional[float]:
+    """mtime of the datastore this task's pre-check reads, or None."""
+    if task.type == "flatpak":
+        path = _FLATPAK_STAMP_PATH
+    elif task.type == "config":
+        path = task.config_file
+    else:  # dnf / group — both resolve against the rpm database
+        path = _RPM_DB_PATH
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def load_done_cache() -> None:
+    """Loads the completed-task cache, tolerating a missing/corrupt file."""
+    global _done_cache
+    if not _cache_enabled:
+        return
+    try:
+        with open(CACHE_FILE, "r") as f:
+            loaded = json.load(f)
+    except (OSError, ValueError):
+        loaded = {}
+    # Valid JSON isn't necessarily a valid cache; keep only dict entries
+    # under a dict top level and silently drop anything else.
+    if not isinstance(loaded, dict):
+        loaded = {}
+    _done_cache = {
+        task_id: entry
+        for task_id, entry in loaded.items()
+        if isinstance(entry, dict)
+    }
+
+
+def save_done_cache() -> None:
+    """Writes the completed-task cache back to disk (registered atexit)."""
+    if not _cache_enabled or not _cache_dirty:
+        return
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        with open(CACHE_FILE, "w") as f:
+            json.dump(_done_cache, f)
+    except OSError:
+        pass  # Cache is best-effort; never fail the run over it
+
+
+def mark_task_done(task: Task) -> None:
+    """Records a task as completed for future invocations."""
+    global _cache_dirty
+    if not _cache_enabled or not _task_cacheable(task):
+        return
+    _done_cache[task.id] = {
+        "signature": _task_signature(task),
+        "stamp": _state_stamp(task),
+    }
+    _cache_dirty = True
+
+
+def is_task_cached_done(task: Task) -> bool:
+    """True if a fresh cache entry says this task already completed."""
+    if not _cache_enabled or not _task_cacheable(task):
+        return False
+    entry = _done_cache.get(task.id)
+    if entry is None or entry.get("signature") != _task_signature(task):
+        return False
+    stamp = _state_stamp(task)
+    return stamp is not None and entry.get("stamp") == stamp
 
 
 def clear_screen() -> None:
-    """Clears the terminal screen."""
-    os.system("clear")
+    """Clears the terminal screen (and scrollback) with a direct ANSI write."""
+    sys.stdout.write("\x1b[H\x1b[2J\x1b[3J")
+    sys.stdout.flush()
 
 
 def check_root() -> None:
@@ -244,155 +411,390 @@ def check_root() -> None:
         sys.exit(1)
 
 
-def show_spinner(message: str = "") -> None:
-    """Displays a brick-style spinner animation in a separate thread."""
-    global spinner_running
-    spinner_running = True
-    spinner_chars = ["⣾", "⣽", "⣻", "⢿", "⡿", "⣟", "⣯", "⣷"]
+_SPINNER_CHARS = ["⣾", "⣽", "⣻", "⢿", "⡿", "⣟", "⣯", "⣷"]
+
 
-    sys.stdout.write(f"\n {C.CYAN}{message} {C.ENDC}")
+class Spinner:
+    """
+    Brick-style spinner ticked cooperatively by whoever is waiting on a
+    subprocess — no background thread, no wakeups of its own. Each tick
+    writes one pre-rendered frame; chars has 8 entries, so `i & 7` wraps.
+    """
 
-    i = 0
-    while not spinner_stop_event.is_set():
-        char = spinner_chars[i % len(spinner_chars)]
-        sys.stdout.write(f"\r {C.CYAN}{message} {char}{C.ENDC}")
+    def __init__(self, message: str) -> None:
+        self.message = message
+        self._frames = [
+            f"\r {C.CYAN}{message} {char}{C.ENDC}" for char in _SPINNER_CHARS
+        ]
+        self._i = 0
+        sys.stdout.write(f"\n {C.CYAN}{message} {C.ENDC}")
         sys.stdout.flush()
-        time.sleep(0.05)
-        i += 1
 
-    sys.stdout.write("\r" + " " * (len(message) + 5) + "\r")  # Clear the line
-    sys.stdout.flush()
-    spinner_running = False
-    spinner_stop_event.clear()
+    def tick(self) -> None:
+        sys.stdout.write(self._frames[self._i & 7])
+        sys.stdout.flush()
+        self._i += 1
+
+    def clear(self) -> None:
+        sys.stdout.write("\r" + " " * (len(self.message) + 5) + "\r")
+        sys.stdout.flush()
+
+
+@functools.lru_cache(maxsize=None)
+def _which(tool: str) -> Optional[str]:
+    """Memoized shutil.which lookup; one PATH search per tool per run."""
+    return shutil.which(tool)
 
 
-def run_command(command: list[str], use_shell: bool = False) -> tuple[bool, str, str]:
+def run_command(
+    command: list[str],
+    use_shell: bool = False,
+    spinner: Optional[Spinner] = None,
+    capture_stdout: bool = True,
+) -> tuple[bool, bytes, bytes]:
     """
     Runs a shell command, capturing stdout and stderr.
+    Shell execution is opt-in: tasks that need $(...) expansion carry a
+    "use_shell": True flag, everything else execs the argv list directly.
+    Output stays as bytes — most callers only look at the return code or
+    scan for a marker, so decoding is left to whoever actually displays it.
+    When a spinner is given, it's ticked while the child runs, from this
+    thread — no spinner thread is spawned.
+    Pass capture_stdout=False for commands whose stdout is never read
+    (installs, upgrades): stdout goes to /dev/null and stderr is streamed
+    into a bounded tail buffer instead of being held in RAM wholesale.
     Returns (success, stdout, stderr)
     """
-    try:
-        # Use shell=True only when needed (e.g., for rpm -E)
-        cmd_str = " ".join(command)
-        if "rpm -E" in cmd_str or ">" in cmd_str:
-            use_shell = True
+    if not use_shell:
+        # Resolve the executable once per tool: missing binaries (flatpak,
+        # gsettings on minimal installs) fail fast without a fork, and the
+        # absolute path spares the child its own PATH search.
+        executable = _which(command[0])
+        if executable is None:
+            return (False, b"", f"Command not found: {command[0]}".encode("utf-8"))
+        command = [executable, *command[1:]]
 
-        process = subprocess.run(
-            cmd_str if use_shell else command,
+    try:
+        # Keep the kwargs minimal so CPython stays on its vfork/posix_spawn
+        # fast path (~2x cheaper process creation than plain fork): no
+        # preexec_fn, default close_fds, no new session. Don't add kwargs
+        # here without checking they don't force the fork fallback.
+        process = subprocess.Popen(
+            shlex.join(command) if use_shell else command,
             shell=use_shell,
-            check=True,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
+            stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            start_new_session=False,
         )
-        return (True, process.stdout, process.stderr)
-    except subprocess.CalledProcessError as e:
-        return (False, e.stdout if e.stdout else "", e.stderr if e.stderr else "")
     except FileNotFoundError as e:
-        return (False, "", f"Command not found: {e.filename}")
+        return (False, b"", f"Command not found: {e.filename}".encode("utf-8"))
+
+    if capture_stdout:
+        while True:
+            try:
+                stdout, stderr = process.communicate(
+                    timeout=0.1 if spinner is not None else None
+                )
+                break
+            except subprocess.TimeoutExpired:
+                spinner.tick()
+        return (process.returncode == 0, stdout, stderr)
+
+    # Stream stderr into a bounded ring buffer: a full `dnf upgrade` can
+    # emit a lot of text and only the tail is ever shown on failure.
+    tail: deque[bytes] = deque(maxlen=32)
+    remainder = b""
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stderr, selectors.EVENT_READ)
+        while True:
+            if not selector.select(timeout=0.1 if spinner is not None else None):
+                if spinner is not None:
+                    spinner.tick()
+                continue
+            chunk = os.read(process.stderr.fileno(), 65536)
+            if not chunk:
+                break
+            remainder += chunk
+            lines = remainder.split(b"\n")
+            remainder = lines.pop()
+            tail.extend(line for line in lines if line)
+    if remainder:
+        tail.append(remainder)
+    process.wait()
+
+    return (process.returncode == 0, b"", b"\n".join(tail))
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_query(command: tuple[str, ...]) -> tuple[bool, bytes, bytes]:
+    """
+    Memoized run_command for read-only probes (rpm -q, flatpak list, etc.).
+    Only use this for commands that don't change system state.
+    """
+    return run_command(list(command))
 
 
-def check_package_installed(pkg_name: str) -> bool:
-    """Checks if a single RPM package is installed."""
-    success, _, _ = run_command(["rpm", "-q", pkg_name])
-    return success
+def clear_query_cache() -> None:
+    """Drops memoized probe results so the next menu pass re-checks the system."""
+    _cached_query.cache_clear()
+    _flatpak_installed_set.cache_clear()
+    _installed_groups_output.cache_clear()
+    _query_token_set.cache_clear()
+    get_installed_versions.cache_clear()
+
+
+_FEDORA_MACRO = "$(rpm -E %fedora)"
+
+
+@functools.lru_cache(maxsize=1)
+def get_fedora_release() -> str:
+    """Returns what `rpm -E %fedora` expands to (e.g. "43"), queried once."""
+    success, stdout, _ = run_command(["rpm", "-E", "%fedora"])
+    return stdout.decode("utf-8", "replace").strip() if success else ""
+
+
+def expand_fedora_macro(command: list[str]) -> list[str]:
+    """
+    Substitutes $(rpm -E %fedora) in command args from the cached release,
+    so commands like the RPM Fusion install never need shell=True.
+    """
+    if not any(_FEDORA_MACRO in arg for arg in command):
+        return command
+    release = get_fedora_release()
+    return [arg.replace(_FEDORA_MACRO, release) for arg in command]
+
+
+# A stalled mirror must fail the prefetch (falling back to dnf's own
+# downloader) rather than hang the task behind a frozen spinner.
+_PREFETCH_TIMEOUT_SECONDS = 30
+
+
+def prefetch_urls(urls: list[str], dest_dir: str) -> dict[str, str]:
+    """
+    Downloads URLs concurrently into dest_dir — a private directory; the
+    shared /tmp would let another local user pre-create/tamper with the
+    predictable filenames before dnf installs them. Each download carries
+    an explicit timeout.
+    Returns a map of url -> local path for the downloads that succeeded.
+    """
+
+    def fetch(url: str) -> Optional[str]:
+        dest = os.path.join(dest_dir, os.path.basename(url))
+        try:
+            with urllib.request.urlopen(
+                url, timeout=_PREFETCH_TIMEOUT_SECONDS
+            ) as response, open(dest, "wb") as f:
+                shutil.copyfileobj(response, f)
+            return dest
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        return {
+            url: path
+            for url, path in zip(urls, executor.map(fetch, urls))
+            if path is not None
+        }
+
+
+def prefetch_remote_rpms(command: list[str]) -> tuple[list[str], Optional[str]]:
+    """
+    For `dnf install` commands referencing several remote .rpm URLs (the
+    RPM Fusion task), downloads them in parallel first — dnf fetches
+    serially — and swaps in the local paths. Returns the command plus the
+    temp directory holding the downloads, which the caller removes after
+    the install. On any download failure or timeout the directory is
+    removed here and the original command is returned (with no directory)
+    so dnf does its own fetching.
+    """
+    if command[:2] != ["dnf", "install"]:
+        return command, None
+    urls = [
+        arg
+        for arg in command
+        if arg.startswith(("http://", "https://")) and arg.endswith(".rpm")
+    ]
+    if len(urls) < 2:
+        return command, None
+    dest_dir = tempfile.mkdtemp(prefix="fedora-setup-")
+    fetched = prefetch_urls(urls, dest_dir)
+    if len(fetched) != len(urls):
+        shutil.rmtree(dest_dir, ignore_errors=True)
+        return command, None
+    return [fetched.get(arg, arg) for arg in command], dest_dir
+
+
+def query_packages_installed(pkg_names: Sequence[str]) -> dict[str, bool]:
+    """
+    Queries every RPM package in the list with one rpm call and returns a
+    per-package installed map. With --qf "%{NAME}\\n" each installed package
+    prints exactly its name; missing ones print "package X is not installed".
+    """
+    if not pkg_names:
+        return {}
+    _, stdout, _ = _cached_query(("rpm", "-q", "--qf", "%{NAME}\n", *pkg_names))
+    installed = {
+        line.strip().decode("utf-8", "replace")
+        for line in stdout.splitlines()
+        if line.strip() and not line.endswith(b"is not installed")
+    }
+    return {pkg: pkg in installed for pkg in pkg_names}
+
+
+def check_packages_installed(pkg_names: Sequence[str]) -> bool:
+    """Checks if every RPM package in the list is installed with one rpm call."""
+    if not pkg_names:
+        return False
+    return all(query_packages_installed(pkg_names).values())
+
+
+@functools.lru_cache(maxsize=1)
+def _flatpak_installed_set() -> frozenset[bytes]:
+    """Installed Flatpak app IDs — one `flatpak list` per menu pass."""
+    success, stdout, _ = _cached_query(
+        ("flatpak", "list", "--app", "--columns=application")
+    )
+    if not success:
+        return frozenset()
+    return frozenset(
+        line.strip() for line in stdout.splitlines() if line.strip()
+    )
 
 
 def check_flatpak_installed(pkg_name: str) -> bool:
     """Checks if a single Flatpak package is installed."""
-    success, stdout, _ = run_command(
-        ["flatpak", "list", "--app", "--columns=application"]
-    )
-    if success:
-        for line in stdout.splitlines():
-            if line.strip() == pkg_name:
-                return True
-    return False
+    return pkg_name.encode("utf-8") in _flatpak_installed_set()
+
+
+@functools.lru_cache(maxsize=1)
+def _installed_groups_output() -> bytes:
+    """Output of one `dnf group list --installed` — serves every group check.
+
+    A single dnf startup (the expensive part) answers for all groups,
+    instead of one `dnf group info` per group task.
+    """
+    success, stdout, _ = _cached_query(("dnf", "group", "list", "--installed"))
+    return stdout if success else b""
 
 
 def check_group_installed(group_name: str) -> bool:
     """Checks if a DNF group is already installed."""
-    success, stdout, _ = run_command(["dnf", "group", "info", group_name])
-    if success:
-        # Check for "Installed" in the output
-        if "Installed" in stdout or "Installed Groups" in stdout:
-            return True
-    return False
+    return group_name.encode("utf-8") in _installed_groups_output()
+
+
+@functools.lru_cache(maxsize=32)
+def _load_config_lines(config_file: str, mtime_ns: int) -> frozenset[str]:
+    """
+    Reads a config file once and returns its stripped lines as a set.
+    Keyed by mtime so the cache self-invalidates when the file is written.
+    """
+    with open(config_file, "r") as f:
+        return frozenset(line.strip() for line in f)
 
 
 def check_config_applied(config_file: str, config_line: str) -> bool:
     """Checks if a specific line already exists in a config file."""
-    if not os.path.exists(config_file):
+    try:
+        mtime_ns = os.stat(config_file).st_mtime_ns
+    except OSError:
         return False
     try:
-        with open(config_file, "r") as f:
-            for line in f:
-                if config_line.strip() == line.strip():
-                    return True
+        return config_line.strip() in _load_config_lines(config_file, mtime_ns)
     except (IOError, PermissionError) as e:
         print(f" {C.FAIL}Error reading config {config_file}: {e}{C.ENDC}")
         return False  # Assume not applied if we can't read
-    return False
 
 
-def apply_config(config_file: str, config_line: str) -> tuple[bool, str, str]:
-    """Appends a line to a config file."""
+def apply_config(config_file: str, config_lines: list[str]) -> tuple[bool, str, str]:
+    """Appends all given lines to a config file in a single write + fsync."""
+    if not config_lines:
+        return (True, "", "")
     try:
         with open(config_file, "a") as f:
-            f.write(f"\n{config_line}\n")
+            f.write("\n" + "\n".join(config_lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
         return (True, "", "")
     except (IOError, PermissionError) as e:
         return (False, "", f"Could not write to {config_file}: {e}")
 
 
-def parse_dnf_updates(output: str) -> list[tuple[str, str, str, str]]:
+@functools.lru_cache(maxsize=1)
+def get_installed_versions() -> dict[str, str]:
     """
-    Parses DNF check-update output and returns a list of (package, current, new, repo) tuples.
+    Dumps the whole rpm database once and returns name -> version-release.
+    One rpm -qa replaces a per-package rpm -q fork when resolving current
+    versions for an update list. Memoized so the pre-warm during the
+    check-update network wait is reused by the parser.
     """
-    updates: list[tuple[str, str, str, str]] = []
-    lines = output.strip().split("\n")
+    success, stdout, _ = run_command(
+        ["rpm", "-qa", "--qf", "%{NAME}\t%{VERSION}-%{RELEASE}\n"]
+    )
+    if not success:
+        return {}
+    installed: dict[str, str] = {}
+    for raw_line in stdout.splitlines():
+        name, sep, version = raw_line.decode("utf-8", "replace").partition("\t")
+        if sep:
+            installed[name] = version
+    return installed
+
+
+def parse_dnf_updates(lines: Iterable[str]) -> Iterator[tuple[str, str, str, str]]:
+    """
+    Parses DNF check-update output line by line, yielding
+    (package, current, new, repo) tuples as they arrive — callers can
+    render rows while dnf is still emitting.
+    """
+    installed_versions = get_installed_versions()
 
     for line in lines:
         line = line.strip()
         if not line or line.startswith("Last metadata") or line.startswith("Security"):
             continue
 
-        parts = line.split()
+        # Only the first three fields matter; maxsplit bails out early
+        parts = line.split(None, 3)
         if len(parts) >= 3:
-            package = parts[0]
-            new_version = parts[1]
-            repo = parts[2]
-
-            # Extract current version if available
-            if "." in package:
-                pkg_parts = package.rsplit(".", 1)
-                pkg_name = pkg_parts[0]
-                arch = pkg_parts[1] if len(pkg_parts) > 1 else ""
-            else:
+            package, new_version, repo = parts[0], parts[1], parts[2]
+
+            # Strip the ".arch" suffix; rpartition is branch-free and
+            # returns ("", "", package) when there is no dot
+            pkg_name, dot, _arch = package.rpartition(".")
+            if not dot:
                 pkg_name = package
-                arch = ""
 
-            # Get current version
-            success, stdout, _ = run_command(
-                ["rpm", "-q", "--queryformat", "%{VERSION}-%{RELEASE}", pkg_name]
-            )
-            current_version = stdout.strip() if success else "N/A"
+            # Get current version from the one-shot rpm -qa dump
+            current_version = installed_versions.get(pkg_name, "N/A")
+
+            yield (package, current_version, new_version, repo)
+
 
-            updates.append((package, current_version, new_version, repo))
+def _truncate(value: str, width: int) -> str:
+    """Clips a cell to the column width, marking the cut with '..'."""
+    return value if len(value) <= width else value[: width - 2] + ".."
 
-    return updates
 
+# Row template bound once; per row it's a single C-level format call
+_ROW_FMT = "{}{:<40} {:<20} {:<20} {:<15}{}".format
 
-def display_updates_table(updates: list[tuple[str, str, str, str]]) -> None:
+
+def display_updates_table(
+    updates: Iterable[tuple[str, str, str, str]],
+) -> list[tuple[str, str, str, str]]:
     """
-    Displays available updates in a modern tabular format.
+    Displays available updates in a modern tabular format, printing each
+    row as it arrives from the parser so the table fills in while dnf is
+    still working. Returns the collected update list.
     """
-    if not updates:
+    iterator = iter(updates)
+    first = next(iterator, None)
+    if first is None:
         print(f"\n{C.GREEN}✔ System is up to date! No packages to upgrade.{C.ENDC}")
-        return
+        return []
 
     print(f"\n{C.HEADER}{C.BOLD}{'=' * 100}{C.ENDC}")
-    print(f"{C.HEADER}{C.BOLD}Available Updates ({len(updates)} packages){C.ENDC}")
+    print(f"{C.HEADER}{C.BOLD}Available Updates{C.ENDC}")
     print(f"{C.HEADER}{C.BOLD}{'=' * 100}{C.ENDC}\n")
 
     # Table headers
@@ -400,21 +802,55 @@ def display_updates_table(updates: list[tuple[str, str, str, str]]) -> None:
     print(header)
     print(f"{C.CYAN}{'-' * 100}{C.ENDC}")
 
+    collected: list[tuple[str, str, str, str]] = []
+
     # Display updates with alternating colors for readability
-    for i, (package, current, new, repo) in enumerate(updates):
+    for i, (package, current, new, repo) in enumerate(
+        itertools.chain([first], iterator)
+    ):
         color = C.GREEN if i % 2 == 0 else C.WARNING
 
-        # Truncate long package names
-        pkg_display = package[:38] + ".." if len(package) > 40 else package
-        current_display = current[:18] + ".." if len(current) > 20 else current
-        new_display = new[:18] + ".." if len(new) > 20 else new
-        repo_display = repo[:13] + ".." if len(repo) > 15 else repo
-
         print(
-            f"{color}{pkg_display:<40} {current_display:<20} {new_display:<20} {repo_display:<15}{C.ENDC}"
+            _ROW_FMT(
+                color,
+                _truncate(package, 40),
+                _truncate(current, 20),
+                _truncate(new, 20),
+                _truncate(repo, 15),
+                C.ENDC,
+            )
         )
+        collected.append((package, current, new, repo))
+
+    print(f"{C.CYAN}{'-' * 100}{C.ENDC}")
+    print(f"{C.HEADER}{C.BOLD}{len(collected)} package(s) can be upgraded{C.ENDC}\n")
+    return collected
+
 
-    print(f"{C.CYAN}{'-' * 100}{C.ENDC}\n")
+# dnf5 (Fedora 41+, what the README targets) keeps solv data in per-repo
+# subdirectories of /var/cache/libdnf5; the flat *.solv layout under
+# /var/cache/dnf is dnf4's, kept for older installs.
+_DNF_CACHE_DIRS = ("/var/cache/libdnf5", "/var/cache/dnf")
+_METADATA_FRESH_SECONDS = 3600
+
+
+def dnf_metadata_is_fresh() -> bool:
+    """
+    True if the newest repo metadata blob (*.solv) in dnf's cache is young
+    enough that forcing --refresh would just re-download the same data.
+    """
+    newest = 0.0
+    for cache_dir in _DNF_CACHE_DIRS:
+        for dirpath, _, filenames in os.walk(cache_dir):
+            for name in filenames:
+                if not name.endswith(".solv"):
+                    continue
+                try:
+                    mtime = os.stat(os.path.join(dirpath, name)).st_mtime
+                except OSError:
+                    continue
+                newest = max(newest, mtime)
+    return newest > 0 and time.time() - newest < _METADATA_FRESH_SECONDS
 
 
 def check_and_confirm_updates() -> bool:
@@ -422,16 +858,39 @@ def check_and_confirm_updates() -> bool:
     Checks for available updates and asks user for confirmation.
     Returns True if user wants to proceed, False otherwise.
     """
-    print(f"\n{C.CYAN}Checking for available updates...{C.ENDC}")
-
-    # Run dnf check-update
-    success, stdout, stderr = run_command(["dnf", "check-update", "--refresh"])
+    # Stream dnf check-update straight through parse and display: rows
+    # appear as dnf emits them instead of after the full buffer lands.
+    # (dnf returns 100 when updates exist; the output is parsed either way.)
+    # Forcing --refresh re-downloads mirror metadata (5-20 s on slow
+    # networks); skip it when the local cache is still fresh.
+    check_argv = ["dnf", "check-update"]
+    if not dnf_metadata_is_fresh():
+        check_argv.append("--refresh")
 
-    # dnf check-update returns 100 when updates are available
-    # Parse the output regardless of return code
-    updates = parse_dnf_updates(stdout)
+    try:
+        process = subprocess.Popen(
+            check_argv,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+    except FileNotFoundError:
+        print(f"{C.FAIL}Error: dnf not found.{C.ENDC}")
+        return False
 
-    display_updates_table(updates)
+    # The metadata fetch is the long silent stretch: tick the spinner until
+    # dnf produces its first output, then let the table stream in. The
+    # rpm -qa version dump runs meanwhile, overlapping dnf's network wait.
+    spinner = Spinner("Checking for available updates...")
+    get_installed_versions()  # warm the memoized rpm -qa dump
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ)
+        while not selector.select(timeout=0.1):
+            spinner.tick()
+    spinner.clear()
+
+    lines = (raw.decode("utf-8", "replace") for raw in process.stdout)
+    updates = display_updates_table(parse_dnf_updates(lines))
+    process.wait()
 
     if not updates:
         print(f"{C.CYAN}Press Enter to return to the main menu...{C.ENDC}")
@@ -464,89 +923,215 @@ def check_and_confirm_updates() -> bool:
             print(f"{C.FAIL}Please enter 'yes' or 'no'.{C.ENDC}")
 
 
-def run_task(task: dict[str, Any]) -> bool:
+def _check_dnf_done(task: Task) -> bool:
+    # One rpm invocation covers the whole list (empty list just runs)
+    return check_packages_installed(task.packages)
+
+
+def _check_flatpak_done(task: Task) -> bool:
+    return check_flatpak_installed(task.package_name)
+
+
+def _check_group_done(task: Task) -> bool:
+    return check_group_installed(task.group_name)
+
+
+def _check_config_done(task: Task) -> bool:
+    return all(
+        check_config_applied(task.config_file, line)
+        for line in task.config_lines
+    )
+
+
+def _check_file_done(task: Task) -> bool:
+    return os.path.exists(task.check_path)
+
+
+@functools.lru_cache(maxsize=None)
+def _query_token_set(command: tuple[str, ...]) -> frozenset[bytes]:
+    """Whitespace tokens of a probe's output, cached per argv tuple."""
+    success, stdout, _ = _cached_query(command)
+    return frozenset(stdout.split()) if success else frozenset()
+
+
+def _check_shell_grep_done(task: Task) -> bool:
+    success, stdout, _ = _cached_query(task.check_command)
+    if not success:
+        return False
+    needle = task.check_grep.encode("utf-8")
+    # O(1) token hit for line/column-exact markers (e.g. the flathub
+    # remote); fall back to a substring scan for patterns that sit inside
+    # a token, like min,max,close in the gsettings button layout.
+    return needle in _query_token_set(task.check_command) or needle in stdout
+
+
+def _check_never_done(task: Task) -> bool:
+    return False  # Default: plain shell tasks always run
+
+
+# Dispatch table replacing the old if/elif chain on task type
+_CHECKERS = {
+    "dnf": _check_dnf_done,
+    "flatpak": _check_flatpak_done,
+    "group": _check_group_done,
+    "config": _check_config_done,
+    "file": _check_file_done,
+    "shell_grep": _check_shell_grep_done,
+}
+
+
+def is_task_already_done(task: Task) -> bool:
+    """
+    Runs a task's pre-check (read-only probes) and returns True if the task
+    is already applied. Safe to call from worker threads. A task's
+    check_type (file / shell_grep on shell tasks) overrides its type.
+    """
+    checker = _CHECKERS.get(task.check_type or task.type, _check_never_done)
+    return checker(task)
+
+
+def check_tasks_already_done(tasks: list[Task]) -> dict[str, bool]:
+    """
+    Runs the pre-checks for all tasks concurrently and returns a map of
+    task id -> already-done. The probes are independent subprocess calls,
+    so a thread pool hides their fork+exec latency behind each other.
+    """
+    if not tasks:
+        return {}
+
+    # Trust fresh on-disk cache entries; only probe the rest
+    done_map = {t.id: True for t in tasks if is_task_cached_done(t)}
+    pending = [t for t in tasks if t.id not in done_map]
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for task, done in zip(pending, executor.map(is_task_already_done, pending)):
+                done_map[task.id] = done
+                if done:
+                    mark_task_done(task)
+    return done_map
+
+
+def is_simple_dnf_install(task: Task) -> bool:
+    """True for dnf tasks whose only command is a plain `dnf install -y <pkgs>`."""
+    return (
+        task.type == "dnf"
+        and len(task.commands) == 1
+        and task.commands[0][:3] == ("dnf", "install", "-y")
+    )
+
+
+def run_dnf_install_batch(tasks: list[Task]) -> tuple[dict[str, bool], str]:
+    """
+    Installs the packages of several simple dnf tasks in one transaction,
+    so metadata refresh, depsolve, and rpm locking happen once instead of
+    once per task. Returns a map of task id -> success, attributed per
+    task by re-querying rpm afterwards, plus the last stderr line when
+    the transaction failed (empty otherwise) so callers can show a cause.
+    """
+    if not tasks:
+        return {}, ""
+
+    all_packages: list[str] = []
+    for task in tasks:
+        all_packages.extend(task.packages)
+
+    spinner = Spinner(
+        f"Installing {len(all_packages)} package(s) in one dnf transaction"
+    )
+    success, _, stderr = run_command(
+        ["dnf", "install", "-y", *all_packages],
+        spinner=spinner,
+        capture_stdout=False,
+    )
+    spinner.clear()
+
+    error_line = ""
+    if not success:
+        error_lines = stderr.decode("utf-8", "replace").splitlines()
+        error_line = error_lines[-1] if error_lines else ""
+
+    # rpm state changed; one fresh query over the union attributes the
+    # result back to every task
+    clear_query_cache()
+    installed = query_packages_installed(all_packages)
+    results: dict[str, bool] = {}
+    for task in tasks:
+        results[task.id] = bool(task.packages) and all(
+            installed.get(pkg, False) for pkg in task.packages
+        )
+        if results[task.id]:
+            mark_task_done(task)
+    return results, error_line
+
+
+def run_task(task: Task, already_done: Optional[bool] = None) -> bool:
     """
     Runs a single task, checking its type and whether it's already done.
     Returns True on success/skip, False on failure.
     """
-    title = task["desc"]
-    task_type = task.get("type", "shell")
-    all_done = True
+    title = task.desc
+    task_type = task.type
 
     # Special handling for system update task (ID: 1)
-    if task.get("id") == "1":
+    if task.id == "1":
         if not check_and_confirm_updates():
             return True  # Return True to indicate user chose to skip (not a failure)
 
     # --- Check if task is already completed ---
-    if task_type == "dnf":
-        packages: list[str] = task.get("packages", [])
-        # Check if all packages in the list are installed
-        all_done = all(check_package_installed(pkg) for pkg in packages)
-        if not packages:
-            all_done = False  # If no packages listed, just run
-
-    elif task_type == "flatpak":
-        package_name: str = task.get("package_name", "")
-        all_done = check_flatpak_installed(package_name)
-
-    elif task_type == "group":
-        group_name: str = task.get("group_name", "")
-        all_done = check_group_installed(group_name)
-
-    elif task_type == "config":
-        config_file: str = task.get("config_file", "")
-        config_lines: list[str] = task.get("config_lines", [])
-        all_done = all(check_config_applied(config_file, line) for line in config_lines)
-
-    elif task_type == "check_file":
-        check_path: str = task.get("check_path", "")
-        all_done = os.path.exists(check_path)
-
-    elif task_type == "shell_grep":
-        check_command: list[str] = task.get("check_command", [])
-        check_grep: str = task.get("check_grep", "")
-        success, stdout, _ = run_command(check_command)
-        all_done = success and check_grep in stdout
-
-    else:
-        all_done = False  # Default to running shell tasks
+    if already_done is None:
+        already_done = is_task_already_done(task)
 
-    if all_done:
+    if already_done:
         print(f" {C.WARNING}✔ Skipping: {title} (Already applied){C.ENDC}")
+        mark_task_done(task)
         return True
 
     # --- Run the task ---
-    spinner_thread = threading.Thread(target=show_spinner, args=(f"Running: {title}",))
-    spinner_thread.start()
-
+    spinner = Spinner(f"Running: {title}")
     task_failed = False
     error_message = ""
 
     if task_type == "config":
-        config_file = task.get("config_file", "")
-        config_lines = task.get("config_lines", [])
-        for line in config_lines:
-            if not check_config_applied(config_file, line):
-                success, _, stderr = apply_config(config_file, line)
-                if not success:
-                    task_failed = True
-                    error_message = stderr
-                    break
+        # Collect what's missing, then append it all in one open/write
+        pending = [
+            line
+            for line in task.config_lines
+            if not check_config_applied(task.config_file, line)
+        ]
+        success, _, stderr = apply_config(task.config_file, pending)
+        if not success:
+            task_failed = True
+            error_message = stderr
     else:
-        commands: list[list[str]] = task.get("commands", [])
-        for command in commands:
-            # RPM Fusion URL needs shell=True to expand $(rpm -E %fedora)
-            cmd_str = " ".join(command)
-            use_shell = "rpm -E" in cmd_str or ">" in cmd_str
-            success, _, stderr = run_command(command, use_shell=use_shell)
+        # Write declared files from Python first — no shell, no echo -e
+        for path, content in task.write_files:
+            try:
+                with open(path, "w") as f:
+                    f.write(content)
+            except (IOError, PermissionError) as e:
+                task_failed = True
+                error_message = f"Could not write to {path}: {e}"
+
+        for command in task.commands if not task_failed else ():
+            command, prefetch_dir = prefetch_remote_rpms(
+                expand_fedora_macro(list(command))
+            )
+            success, _, stderr = run_command(
+                command,
+                use_shell=task.use_shell,
+                spinner=spinner,
+                capture_stdout=False,
+            )
+            if prefetch_dir is not None:
+                shutil.rmtree(prefetch_dir, ignore_errors=True)
             if not success:
                 task_failed = True
-                error_message = stderr
+                # Decode only on failure, and only for display
+                error_message = stderr.decode("utf-8", "replace")
                 break
 
-    spinner_stop_event.set()
-    spinner_thread.join()
+    spinner.clear()
 
     if task_failed:
         print(f" {C.FAIL}✘ FAILED: {title}{C.ENDC}")
@@ -556,25 +1141,45 @@ def run_task(task: dict[str, Any]) -> bool:
         return False
     else:
         print(f" {C.GREEN}✔ SUCCESS: {title}{C.ENDC}")
+        mark_task_done(task)
         return True
 
 
-def display_menu() -> None:
-    """Prints the main selection menu."""
-    clear_screen()
-    print(f"{C.HEADER}{C.BOLD}============================================={C.ENDC}")
-    print(f"{C.HEADER}{C.BOLD} Fed-up(Fedora Post-Installation Setup Tool) {C.ENDC}")
-    print(f"{C.HEADER}{C.BOLD}============================================={C.ENDC}")
-    print(f"Select tasks to perform (e.g., 1,3,7 or 5-8).\n")
+# Static menu header, formatted once at import
+_MENU_HEADER = (
+    f"{C.HEADER}{C.BOLD}============================================={C.ENDC}\n"
+    f"{C.HEADER}{C.BOLD} Fed-up(Fedora Post-Installation Setup Tool) {C.ENDC}\n"
+    f"{C.HEADER}{C.BOLD}============================================={C.ENDC}\n"
+    "Select tasks to perform (e.g., 1,3,7 or 5-8).\n"
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _render_menu() -> str:
+    """Builds the full menu string once; TASKS never changes at runtime."""
+    lines = [_MENU_HEADER]
 
     for category, tasks in TASKS.items():
-        print(f"\n{C.BLUE}{C.BOLD}{category}{C.ENDC}")
+        lines.append(f"\n{C.BLUE}{C.BOLD}{category}{C.ENDC}")
         for task in tasks:
-            print(f"  {C.GREEN}[{task['id'].rjust(2)}] {C.ENDC}{task['desc']}")
+            lines.append(f"  {C.GREEN}[{task.id.rjust(2)}] {C.ENDC}{task.desc}")
+
+    lines.append("\n" + "=" * 41)
+    lines.append(f"  {C.GREEN}[all] {C.ENDC}Run all tasks")
+    lines.append(f"  {C.GREEN}[q]   {C.ENDC}Quit the script\n")
+
+    return "\n".join(lines) + "\n"
+
+
+def display_menu() -> None:
+    """Prints the main selection menu in a single stdout write."""
+    clear_screen()
+    sys.stdout.write(_render_menu())
+    sys.stdout.flush()
+
 
-    print("\n" + "=" * 41)
-    print(f"  {C.GREEN}[all] {C.ENDC}Run all tasks")
-    print(f"  {C.GREEN}[q]   {C.ENDC}Quit the script\n")
+# Matches a single selection token: either "7" or a range like "5-8"
+_CHOICE_RE = re.compile(r"(\d+)(?:-(\d+))?")
 
 
 def get_user_choices() -> list[str] | Literal["quit"] | None:
@@ -582,7 +1187,6 @@ def get_user_choices() -> list[str] | Literal["quit"] | None:
     Gets and parses the user's task selections, supporting ranges.
     Returns a list of task IDs to run, "quit", or None on error.
     """
-    all_task_ids = {task["id"] for tasks in TASKS.values() for task in tasks}
     selected_ids: set[str] = set()
 
     choice_str = input(f"{C.GREEN}❯ {C.ENDC}").strip().lower()
@@ -591,7 +1195,7 @@ def get_user_choices() -> list[str] | Literal["quit"] | None:
         return "quit"
 
     if choice_str == "all":
-        return sorted(list(all_task_ids), key=int)
+        return list(_SORTED_TASK_IDS)
 
     parts = choice_str.split(",")
     invalid_choices: list[str] = []
@@ -600,27 +1204,25 @@ def get_user_choices() -> list[str] | Literal["quit"] | None:
         part = part.strip()
         if not part:
             continue
-        if "-" in part:
-            # Handle range (e.g., 5-8)
-            try:
-                range_parts = part.split("-")
-                start, end = int(range_parts[0]), int(range_parts[1])
-                if start > end:
-                    start, end = end, start
-                for i in range(start, end + 1):
-                    task_id = str(i)
-                    if task_id in all_task_ids:
-                        selected_ids.add(task_id)
-                    else:
-                        invalid_choices.append(task_id)
-            except (ValueError, IndexError):
-                invalid_choices.append(part)
-        else:
-            # Handle single number
-            if part.isdigit() and part in all_task_ids:
-                selected_ids.add(part)
+
+        # One regex pass handles both single numbers and ranges (e.g. 5-8);
+        # anything that doesn't fully match (e.g. "5-8-9") is invalid
+        match = _CHOICE_RE.fullmatch(part)
+        if not match:
+            invalid_choices.append(part)
+            continue
+
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else start
+        if start > end:
+            start, end = end, start
+
+        for i in range(start, end + 1):
+            task_id = str(i)
+            if task_id in _ALL_TASK_IDS:
+                selected_ids.add(task_id)
             else:
-                invalid_choices.append(part)
+                invalid_choices.append(task_id)
 
     if invalid_choices:
         print(f"{C.FAIL}Error: Invalid task IDs: {', '.join(invalid_choices)}{C.ENDC}")
@@ -634,7 +1236,11 @@ def main() -> None:
     """Main execution loop."""
     check_root()
 
+    load_done_cache()
+    atexit.register(save_done_cache)
+
     while True:
+        clear_query_cache()  # Re-probe system state on each menu pass
         display_menu()
         selected_ids = get_user_choices()
 
@@ -644,9 +1250,6 @@ def main() -> None:
         if not selected_ids:
             continue  # Show menu again on invalid input
 
-        # Create a flat map of all tasks by ID for easy lookup
-        all_tasks_map = {task["id"]: task for tasks in TASKS.values() for task in tasks}
-
         print("\n" + "=" * 41)
         print(
             f"{C.HEADER}{C.BOLD}Starting setup for {len(selected_ids)} selected task(s)...{C.ENDC}"
@@ -656,14 +1259,48 @@ def main() -> None:
         tasks_succeeded = 0
         tasks_failed: list[str] = []
 
+        # Run all "already applied?" probes concurrently up front; the
+        # install phase below stays serial (dnf holds an exclusive lock).
+        done_map = check_tasks_already_done(
+            [_TASK_BY_ID[task_id] for task_id in selected_ids]
+        )
+
+        # Coalesce all pending plain `dnf install -y` tasks into a single
+        # transaction; swap/groupupdate/systemctl-style tasks stay serial.
+        batchable = [
+            _TASK_BY_ID[task_id]
+            for task_id in selected_ids
+            if not done_map.get(task_id)
+            and is_simple_dnf_install(_TASK_BY_ID[task_id])
+        ]
+        batch_ids = {t.id for t in batchable} if len(batchable) > 1 else set()
+        batch_results: Optional[dict[str, bool]] = None
+        batch_error = ""
+
         for task_id in selected_ids:
-            task = all_tasks_map[task_id]
+            task = _TASK_BY_ID[task_id]
             print()  # Add space before each task
 
-            if run_task(task):
+            if task_id in batch_ids:
+                if batch_results is None:
+                    # Deferred until the loop reaches the first batched
+                    # task, so earlier serial tasks (e.g. enabling RPM
+                    # Fusion) have already run and their repos are usable.
+                    batch_results, batch_error = run_dnf_install_batch(batchable)
+                if batch_results[task_id]:
+                    print(f" {C.GREEN}✔ SUCCESS: {task.desc}{C.ENDC}")
+                    tasks_succeeded += 1
+                else:
+                    print(f" {C.FAIL}✘ FAILED: {task.desc}{C.ENDC}")
+                    if batch_error:
+                        print(f"   {C.FAIL}Error: {batch_error}{C.ENDC}")
+                    tasks_failed.append(f"Task {task_id} ({task.desc})")
+                continue
+
+            if run_task(task, already_done=done_map.get(task_id)):
                 tasks_succeeded += 1
             else:
-                tasks_failed.append(f"Task {task_id} ({task['desc']})")
+                tasks_failed.append(f"Task {task_id} ({task.desc})")
 
         # --- Final Summary ---
         print("\n" + "=" * 41)
@@ -685,8 +1322,5 @@ if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        # Ensure spinner stops if user presses Ctrl+C
-        if spinner_running:
-            spinner_stop_event.set()
         print(f"\n\n{C.WARNING}Script interrupted by user. Exiting.{C.ENDC}")
         sys.exit(1)